@@ -1,8 +1,15 @@
+from concurrent.futures import ProcessPoolExecutor
 from ctypes import ArgumentError
 from dataclasses import dataclass
+from functools import partial
+import hashlib
+import os
 from pathlib import Path
+import pickle
+import shutil
 
-from mippet import construct, lex, parse, register
+import mippet
+from mippet import construct, lex, parse, peephole, register
 
 
 @dataclass
@@ -36,34 +43,89 @@ class Arguments:
         return cls(executable, target, build_dir, verbose, extension)
 
 
-def build_dir(args: Arguments, target: Path):
-    target_relative = target.relative_to(Path.cwd())
+def build_dir(args: Arguments, target: Path, cwd: Path):
+    target_relative = target.relative_to(cwd)
     print(f'Entering {target_relative}')
-    for child in target.glob('*'):
-        build(args, child)
+    files = [
+        child for child in target.rglob('*')
+        if child.is_file() and args.build_dir not in child.parents
+    ]
+    if not files:
+        return
+    for directory in {(args.build_dir / f.relative_to(cwd)).parent for f in files}:
+        directory.mkdir(parents=True, exist_ok=True)
+    print('\n'.join(f'Building {f.relative_to(cwd)}' for f in files))
+    chunksize = max(1, len(files) // (4 * (os.cpu_count() or 1)))
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(partial(build_file, args, cwd=cwd), files, chunksize=chunksize))
 
 
-def build_file(args: Arguments, target: Path):
-    target_relative = target.relative_to(Path.cwd())
-    print(f'Building {target_relative}')
-    source = target.read_text()
+# Cached ASTs are only valid for the compiler that pickled them, so each
+# compiler gets its own cache directory and older ones are deleted.
+COMPILER_DIGEST = hashlib.blake2b(
+    b''.join(p.read_bytes() for p in sorted(Path(mippet.__file__).parent.rglob('*.py'))),
+    digest_size=16,
+).hexdigest()
+
+
+def ast_cache_dir(args: Arguments) -> Path:
+    return args.build_dir / '.ast_cache' / COMPILER_DIGEST
+
+
+def prune_ast_cache(args: Arguments):
+    for generation in (args.build_dir / '.ast_cache').iterdir():
+        if generation.name == COMPILER_DIGEST:
+            continue
+        if generation.is_dir():
+            shutil.rmtree(generation, ignore_errors=True)
+        else:
+            generation.unlink(missing_ok=True)
+
+
+def load_ast(args: Arguments, target_relative: Path, source: str):
+    # One pickle per source file, so an edited source replaces its entry
+    name = hashlib.blake2b(str(target_relative).encode(), digest_size=16).hexdigest()
+    cache = ast_cache_dir(args) / f'{name}.pkl'
+    digest = hashlib.blake2b(source.encode(), digest_size=16).digest()
+    if cache.is_file():
+        try:
+            cached_digest, ast = pickle.loads(cache.read_bytes())
+            if cached_digest == digest:
+                return ast
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
     ast = parse(lex(source))
+    # Write then rename, so a concurrent reader never sees a partial pickle
+    temporary = cache.with_name(f'{name}.{os.getpid()}.tmp')
+    temporary.write_bytes(pickle.dumps((digest, ast), protocol=5))
+    os.replace(temporary, cache)
+    return ast
+
+
+def build_file(args: Arguments, target: Path, cwd: Path):
+    target_relative = target.relative_to(cwd)
+    source = target.read_text()
+    ast = load_ast(args, target_relative, source)
     context = register(ast)
     context.validate()
     context.verbose = args.verbose
-    result = construct(ast, context)
+    result = peephole(construct(ast, context))
     target_path = target_relative
     build_target = (args.build_dir / target_path).with_suffix(args.extension)
-    build_target.parent.mkdir(parents=True, exist_ok=True)
     build_target.write_text(result)
 
 
 def build(args: Arguments, target: Path):
+    cwd = Path.cwd()
+    ast_cache_dir(args).mkdir(parents=True, exist_ok=True)
+    prune_ast_cache(args)
     if target.is_dir():
-        return build_dir(args, target)
+        return build_dir(args, target, cwd)
+    target_relative = target.relative_to(cwd)
     if target.is_file():
-        return build_file(args, target)
-    target_relative = target.relative_to(Path.cwd())
+        print(f'Building {target_relative}')
+        (args.build_dir / target_relative).parent.mkdir(parents=True, exist_ok=True)
+        return build_file(args, target, cwd)
     print(f'Skipping {target_relative}: not a file')
 
 
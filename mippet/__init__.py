@@ -2,6 +2,7 @@ from . import nodes
 from .lexer import lex
 from .nodes import construct, register
 from .parse import parse
+from .peephole import peephole
 
-__all__ = 'construct', 'lex', 'nodes', 'parse', 'register'
+__all__ = 'construct', 'lex', 'nodes', 'parse', 'peephole', 'register'
 
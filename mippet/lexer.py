@@ -1,17 +1,63 @@
-from rply import LexerGenerator
+from functools import cache
+import re
+from typing import Iterator
+
+from rply import LexingError, Token
+from rply.token import SourcePosition
 
 from .tokens import Tokens
 
 __all__ = 'lex',
 
 
-lg = LexerGenerator()
-
-for name, value in Tokens.items():
-    lg.add(name, value)
-lg.ignore(r'[ \t\r\n]')
-
-lexer = lg.build()
-
-lex = lexer.lex
-
+# Alternatives are tried left to right, so the most common tokens come first.
+# A token that overlaps a more general one must still precede it (e.g.
+# KWD_PROC before IDENTIFIER); the remaining tokens keep their order in Tokens.
+FREQUENT = '_SKIP', 'REGISTER', 'COMMA', 'SEMI', 'KWD_PROC', 'IDENTIFIER', 'HEX_NUMBER', 'NUMBER'
+
+# Every directive has the shape of SECTION, so they share one alternative and
+# are told apart afterwards, rather than being tried one by one on every token.
+DIRECTIVES = tuple(
+    (name, re.compile(pattern)) for name, pattern in Tokens.items() if name.endswith('_SECTION')
+)
+
+PATTERNS = {
+    '_SKIP': r'[ \t\r\n]+',
+    '_DIRECTIVE': Tokens.SECTION.value,
+    **{name: pattern for name, pattern in Tokens.items() if not name.endswith('SECTION')},
+}
+
+TOKEN_RE = re.compile('|'.join(
+    [f'(?P<{name}>{PATTERNS[name]})' for name in FREQUENT]
+    + [f'(?P<{name}>{value})' for name, value in PATTERNS.items() if name not in FREQUENT]
+    + [r'(?P<_ERROR>.)']
+))
+
+
+@cache
+def directive(text: str) -> str:
+    for name, pattern in DIRECTIVES:
+        if pattern.fullmatch(text):
+            return name
+    return 'SECTION'
+
+
+def lex(source: str) -> Iterator[Token]:
+    lineno, line_start, last = 1, 0, 0
+    for match in TOKEN_RE.finditer(source):
+        name = match.lastgroup
+        if name == '_SKIP':
+            continue
+        start = match.start()
+        newlines = source.count('\n', last, start)
+        if newlines:
+            lineno += newlines
+            line_start = source.rfind('\n', last, start) + 1
+        last = start
+        source_pos = SourcePosition(start, lineno, start - line_start + 1)
+        if name == '_ERROR':
+            raise LexingError(f'Unexpected character {match.group()!r}', source_pos)
+        text = match.group()
+        if name == '_DIRECTIVE':
+            name = directive(text)
+        yield Token(name, text, source_pos)
@@ -2,14 +2,11 @@ from __future__ import annotations
 
 from abc import ABC
 from dataclasses import dataclass, field
-from pathlib import Path
-from typing import Iterable
+from functools import cache
 
+from .. import syscalls
 from .node import *
 
-__dir__ = Path(__file__).parent
-root = __dir__.parent
-
 
 @dataclass
 class SpillContext:
@@ -20,38 +17,23 @@ class SpillContext:
         _construct = partial(construct, ctxt=self.ctxt)
         if not registers:
             return ''
-        comment = [CommentNode('Spill the register{} {}'.format('' if len(registers) == 1 else 's', ', '.join(map(_construct, registers))))]
-        self.stack.append(registers)
-        if not depth:
-            return construct(comment + [
-                AddIntegerInstruction(RegisterNode.sp, RegisterNode.sp, NumberNode(len(registers) * -4)),
-                [
-                    StoreWordInstruction(PointerNode(RegisterNode.sp, NumberNode(i * 4)), r)
-                    for i, r in enumerate(registers, 1)
-                ]
-            ], self.ctxt)
-        if len(registers) > 1:
-            self.ctxt.verbose, verbose = False, self.ctxt.verbose
-            top = self.spill(registers[-1], depth=depth)
-            rest = self.spill(*registers[:-1], depth=depth)
-            self.ctxt.verbose = verbose
+        comment: list[Node] = []
+        # A single register tucked under the kept items is spilled without comment
+        if not depth or len(registers) > 1:
+            comment.append(CommentNode('Spill the register{} {}'.format('' if len(registers) == 1 else 's', ', '.join(map(_construct, registers)))))
             if depth == 1:
                 comment.append(CommentNode(f'but keep the top item at the top of the stack'))
-            else:
+            elif depth:
                 comment.append(CommentNode(f'but keep the top {depth} items at the top of the stack'))
-            return construct([comment, top, rest], self.ctxt)
-        register = registers[0]
-        return construct([
-            AddIntegerInstruction(RegisterNode.sp, RegisterNode.sp, NumberNode(-4)),
-            [
-                [
-                    LoadWordInstruction(RegisterNode('$t9'), PointerNode(RegisterNode.sp, NumberNode((i+1) * 4))),
-                    StoreWordInstruction(PointerNode(RegisterNode.sp, NumberNode(i*4)), RegisterNode('$t9')),
-                ]
-                for i in range(1, depth + 1)
-            ],
-            StoreWordInstruction(PointerNode(RegisterNode.sp, NumberNode((depth+1) * 4)), register),
-        ], self.ctxt)
+        self.stack.append(registers)
+        size = len(registers)
+        ops: list[Node] = [AddIntegerInstruction(RegisterNode.sp, RegisterNode.sp, NumberNode(size * -4))]
+        for i in range(1, depth + 1):
+            ops.append(LoadWordInstruction(RegisterNode.t9, PointerNode(RegisterNode.sp, NumberNode((size+i) * 4))))
+            ops.append(StoreWordInstruction(PointerNode(RegisterNode.sp, NumberNode(i*4)), RegisterNode.t9))
+        for i, r in enumerate(registers, depth + 1):
+            ops.append(StoreWordInstruction(PointerNode(RegisterNode.sp, NumberNode(i * 4)), r))
+        return construct(comment + ops, self.ctxt)
 
     def unspill(self, registers: tuple[RegisterNode, ...] | None = None):
         if registers is None:
@@ -66,17 +48,49 @@ class SpillContext:
         ] + [
             AddIntegerInstruction(RegisterNode.sp, RegisterNode.sp, NumberNode(4 * len(registers))),
         ], self.ctxt)
+
+
+@cache
+def spill_template(registers: tuple[RegisterNode, ...], depth: int, verbose: bool) -> tuple[str, str]:
+    spill_ctxt = SpillContext(Context(verbose=verbose))
+    return spill_ctxt.spill(*registers, depth=depth), spill_ctxt.unspill()
+
+
+@cache
+def syscall_template(syscall_name: str, verbose: bool) -> str:
+    syscall_id = syscalls.SYSCALLS.get(syscall_name)
+    if syscall_id is None:
+        raise ValueError(f'Unknown syscall {syscall_name}')
+    spill, unspill = spill_template((RegisterNode.v0,), 0, verbose)
+    return construct([
+        spill,
+        LoadIntegerInstruction(RegisterNode.v0, NumberNode(syscall_id)),
+        SyscallInstruction(),
+        StoreWordInstruction(IdentifierNode('_return'), RegisterNode.v0),
+        unspill,
+    ], Context(verbose=verbose))
      
 
-class InstructionNode(Node, ABC):
-    _subclasses: dict[str, type[InstructionNode]] = {}
-    __mneumonic__: str | None = None
+# mneumonic -> bound parse_arguments of the registered class, filled by @instruction
+_PARSE_TABLE: dict[str, Callable[[list[Node], IdentifierNode], InstructionNode]] = {}
+
 
-   
-    def __init_subclass__(cls, *, mneumonic: str, **kwargs) -> None:
-        cls._subclasses[mneumonic] = cls
+def instruction(mneumonic: str) -> Callable[[type[InstructionNode]], type[InstructionNode]]:
+    """Register an InstructionNode subclass as the parser for `mneumonic`
+    Apply it above @dataclass, which replaces the class when adding slots
+    """
+    def decorator(cls: type[InstructionNode]) -> type[InstructionNode]:
         cls.__mneumonic__ = mneumonic
-        return super().__init_subclass__(**kwargs)
+        _PARSE_TABLE[mneumonic] = cls.parse_arguments
+        return cls
+    return decorator
+
+
+class InstructionNode(Node, ABC):
+    __slots__ = ()
+    __mneumonic__: str | None = None
+    # Accepted node types for each positional argument, in source order
+    __operands__: tuple[tuple[type[Node], ...], ...] = ()
 
     @property
     def mneumonic(cls) -> str:
@@ -85,347 +99,380 @@ class InstructionNode(Node, ABC):
         return cls.__mneumonic__
 
     @property
-    def arguments(self) -> Iterable[Node]:
-        return []
+    def arguments(self) -> tuple[Node, ...]:
+        return ()
 
-    def register(self, ctxt: Context) -> Context:
-        for arg in self.arguments:
-            ctxt = register(arg, ctxt)
-        return super().register(ctxt)
+    def register(self, ctxt: Context) -> list[Node] | tuple[Node, ...] | None:
+        return self.arguments
 
     def construct(self, ctxt: Context) -> str:
-        return f'    {self.mneumonic} ' + ', '.join(a.construct(ctxt) for a in self.arguments)
+        arguments = [a.construct(ctxt) for a in self.arguments]
+        return f'    {self.mneumonic} {", ".join(arguments)}'
 
     @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        return cls()
+    def check_arguments(cls, arguments: list[Node]) -> None:
+        operands = cls.__operands__
+        if len(arguments) != len(operands):
+            raise ValueError(f'`{cls.__mneumonic__}` expects {len(operands)} argument(s), got {len(arguments)}')
+        for i, (arg, types) in enumerate(zip(arguments, operands), 1):
+            if type(arg) not in types:
+                expected = ' or '.join(t.__name__ for t in types)
+                raise ValueError(f'Expected {expected} as argument {i} to `{cls.__mneumonic__}`, got `{type(arg).__name__}`')
+
+    @classmethod
+    def parse_arguments(cls, arguments: list[Node], mneumonic: IdentifierNode | None = None) -> InstructionNode:
+        cls.check_arguments(arguments)
+        return cls(*arguments)
 
     @classmethod
     def parse(cls, mneumonic: IdentifierNode, arguments: list[Node]) -> InstructionNode:
-        instruction_cls = cls._subclasses.get(mneumonic.name, GenericInstruction)
-        if instruction_cls is GenericInstruction:
-            arguments.insert(0, mneumonic)
-        return instruction_cls.parse_arguments(arguments)
+        return _PARSE_TABLE.get(mneumonic.name, _PARSE_DEFAULT)(arguments, mneumonic)
 
 
-@dataclass
-class GenericInstruction(InstructionNode, mneumonic=''):
-    _arguments: list[Node]
+@dataclass(slots=True)
+class GenericInstruction(InstructionNode):
+    _mneumonic: str
+    _arguments: tuple[Node, ...]
 
     @property
-    def arguments(self) -> Iterable[Node]:
+    def mneumonic(self) -> str:
+        return self._mneumonic
+
+    @property
+    def arguments(self) -> tuple[Node, ...]:
         return self._arguments
 
     @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        mneumonic, *arguments = arguments
-        self = cls(arguments)
+    def parse_arguments(cls, arguments: list[Node], mneumonic: IdentifierNode | None = None) -> InstructionNode:
         assert isinstance(mneumonic, IdentifierNode)
-        self.__mneumonic__ = mneumonic.name
-        return self
+        return cls(mneumonic.name, tuple(arguments))
+
+
+_PARSE_DEFAULT = GenericInstruction.parse_arguments
  
 
-@dataclass
-class JumpInstruction(InstructionNode, mneumonic='j'):
+@instruction('j')
+@dataclass(slots=True)
+class JumpInstruction(InstructionNode):
+    __operands__ = (IdentifierNode,),
+
     target: IdentifierNode
 
     @property
-    def arguments(self) -> Iterable[Node]:
-        return [self.target]
+    def arguments(self) -> tuple[Node, ...]:
+        return self.target,
 
-    @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        target = arguments[0]
-        if not isinstance(target, IdentifierNode):
-            raise ValueError(f'Expected an identifier as the argument to `j`')
-        return cls(target)
 
+@instruction('jal')
+@dataclass(slots=True)
+class JumpAndLinkInstruction(InstructionNode):
+    __operands__ = (IdentifierNode,),
 
-@dataclass
-class JumpAndLinkInstruction(InstructionNode, mneumonic='jal'):
     target: IdentifierNode
 
     @property
-    def arguments(self) -> Iterable[Node]:
-        return [self.target]
+    def arguments(self) -> tuple[Node, ...]:
+        return self.target,
 
-    @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        target = arguments[0]
-        if not isinstance(target, IdentifierNode):
-            raise ValueError(f'`jal` expected an identifier as the first parameter')
-        return cls(target)
 
+@instruction('jr')
+@dataclass(slots=True)
+class JumpRegisterInstruction(InstructionNode):
+    __operands__ = (RegisterNode,),
 
-@dataclass
-class JumpRegisterInstruction(InstructionNode, mneumonic='jr'):
     target: RegisterNode
 
     @property
-    def arguments(self) -> Iterable[Node]:
-        return [self.target]
+    def arguments(self) -> tuple[Node, ...]:
+        return self.target,
 
-    @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        target = arguments[0]
-        if not isinstance(target, RegisterNode):
-            raise ValueError('`jr` expected a register as the parameter')
-        return cls(target)
 
+@instruction('li')
+@dataclass(slots=True)
+class LoadIntegerInstruction(InstructionNode):
+    __operands__ = (RegisterNode,), (NumberNode,)
 
-@dataclass
-class LoadIntegerInstruction(InstructionNode, mneumonic='li'):
     reg: RegisterNode = field()
     value: NumberNode
 
     @property
-    def arguments(self) -> Iterable[Node]:
-        return [self.reg, self.value]
+    def arguments(self) -> tuple[Node, ...]:
+        return self.reg, self.value
 
-    @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        reg, value = arguments
-        if not isinstance(reg, RegisterNode):
-            raise ValueError(f'Expected a reg as the first argument to `li`')
-        if not isinstance(value, NumberNode):
-            raise ValueError(f'Expected an integer as the second argument to `li`')
-        return cls(reg, value)
 
+@instruction('lw')
+@dataclass(slots=True)
+class LoadWordInstruction(InstructionNode):
+    __operands__ = (RegisterNode,), (PointerNode, IdentifierNode)
 
-@dataclass
-class LoadWordInstruction(InstructionNode, mneumonic='lw'):
     destination: RegisterNode
     source: PointerNode | IdentifierNode
 
     @property
-    def arguments(self) -> Iterable[Node]:
-        return [self.destination, self.source]
+    def arguments(self) -> tuple[Node, ...]:
+        return self.destination, self.source
 
-    @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        destination, source = arguments
-        if not isinstance(destination, RegisterNode):
-            raise ValueError(f'Expected a register as the first argument to `lw`')
-        if not isinstance(source, (PointerNode, IdentifierNode)):
-            raise ValueError(f'Expected a pointer or identifier as the second argument to `lw`, got `{type(source).__name__}`')
-        return cls(destination, source)
 
+@instruction('sw')
+@dataclass(slots=True)
+class StoreWordInstruction(InstructionNode):
+    __operands__ = (RegisterNode,), (PointerNode, IdentifierNode)
 
-@dataclass
-class StoreWordInstruction(InstructionNode, mneumonic='sw'):
     destination: PointerNode | IdentifierNode
     source: RegisterNode
 
     @property
-    def arguments(self) -> Iterable[Node]:
-        return [self.source, self.destination]
+    def arguments(self) -> tuple[Node, ...]:
+        return self.source, self.destination
 
     @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
+    def parse_arguments(cls, arguments: list[Node], mneumonic: IdentifierNode | None = None) -> InstructionNode:
+        cls.check_arguments(arguments)
         source, destination = arguments
-        if not isinstance(source, RegisterNode):
-            raise ValueError(f'Expected a register as the first argument to `lw`')
-        if not isinstance(destination, (PointerNode, IdentifierNode)):
-            raise ValueError(f'Expected a pointer as the second argument to `lw`')
         return cls(destination, source)
 
 
-@dataclass
-class MoveInstruction(InstructionNode, mneumonic='move'):
+@instruction('move')
+@dataclass(slots=True)
+class MoveInstruction(InstructionNode):
+    __operands__ = (RegisterNode,), (RegisterNode,)
+
     source: RegisterNode
     destination: RegisterNode
 
     @property
-    def arguments(self) -> Iterable[Node]:
-        return [self.destination, self.source]
+    def arguments(self) -> tuple[Node, ...]:
+        return self.destination, self.source
 
     @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
+    def parse_arguments(cls, arguments: list[Node], mneumonic: IdentifierNode | None = None) -> InstructionNode:
+        cls.check_arguments(arguments)
         destination, source = arguments
-        if not isinstance(destination, RegisterNode):
-            raise ValueError('`move` expected a register as the first argument')
-        if not isinstance(source, RegisterNode):
-            raise ValueError('`move` expected a register as the second argument')
         return cls(source, destination)
 
 
-@dataclass
-class PushInstuction(InstructionNode, mneumonic='push'):
+@instruction('push')
+@dataclass(slots=True)
+class PushInstuction(InstructionNode):
+    __operands__ = (RegisterNode,),
+
     source: RegisterNode
 
     def construct(self, ctxt: Context) -> str:
-        return construct(SpillContext(ctxt).spill(self.source), ctxt)
+        spill, _ = spill_template((self.source,), 0, ctxt.verbose)
+        return spill
 
-    @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        source = arguments[0]
-        if not isinstance(source, RegisterNode):
-            raise ValueError(f'`push` expects a pointer as the argument')
-        return cls(source)
 
+@instruction('pop')
+@dataclass(slots=True)
+class PopInstruction(InstructionNode):
+    __operands__ = (RegisterNode,),
 
-@dataclass
-class PopInstruction(InstructionNode, mneumonic='pop'):
     destination: RegisterNode | None = None
 
     def construct(self, ctxt: Context) -> str:
         if not self.destination:
             return construct(AddIntegerInstruction(RegisterNode.sp, RegisterNode.sp, NumberNode(4)), ctxt)
-        return construct(SpillContext(ctxt).unspill((self.destination,)), ctxt)
+        _, unspill = spill_template((self.destination,), 0, ctxt.verbose)
+        return unspill
 
     @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
+    def parse_arguments(cls, arguments: list[Node], mneumonic: IdentifierNode | None = None) -> InstructionNode:
         if len(arguments) == 0:
             return cls()
-        destination = arguments[0]
-        if not isinstance(destination, RegisterNode):
-            raise ValueError(f'`pop` expects a pointer as the argument')
-        return cls(destination)
+        cls.check_arguments(arguments)
+        return cls(*arguments)
 
 
-@dataclass
-class MathIntegerInstruction(InstructionNode, mneumonic=''):
+@dataclass(slots=True)
+class MathIntegerInstruction(InstructionNode):
+    __operands__ = (RegisterNode,), (RegisterNode,), (NumberNode,)
+
     destination: RegisterNode
     source: RegisterNode
     value: NumberNode
 
     @property
-    def arguments(self) -> Iterable[Node]:
-        return [self.destination, self.source, self.value]
+    def arguments(self) -> tuple[Node, ...]:
+        return self.destination, self.source, self.value
 
-    @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        destination, source, value = arguments
-        if not isinstance(destination, RegisterNode):
-            raise ValueError(f'Expected a register as the first argument to `{cls.mneumonic}`')
-        if not isinstance(source, RegisterNode):
-            raise ValueError(f'Expected a register as the second argument to `{cls.mneumonic}`')
-        if not isinstance(value, NumberNode):
-            raise ValueError(f'Expected an integer as the third argument to `{cls.mneumonic}`')
-        return cls(destination, source, value)
 
+@dataclass(slots=True)
+class MathRegisterInstruction(InstructionNode):
+    __operands__ = (RegisterNode,), (RegisterNode,), (RegisterNode,)
 
-@dataclass
-class MathRegisterInstruction(InstructionNode, mneumonic=''):
     destination: RegisterNode
     source: RegisterNode
     value: RegisterNode
 
     @property
-    def arguments(self) -> Iterable[Node]:
-        return [self.destination, self.source, self.value]
+    def arguments(self) -> tuple[Node, ...]:
+        return self.destination, self.source, self.value
 
-    @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        destination, source, value = arguments
-        if not isinstance(destination, RegisterNode):
-            raise ValueError(f'Expected a register as the first argument to `{cls.mneumonic}`')
-        if not isinstance(source, RegisterNode):
-            raise ValueError(f'Expected a register as the second argument to `{cls.mneumonic}`')
-        if not isinstance(value, RegisterNode):
-            raise ValueError(f'Expected an register as the third argument to `{cls.mneumonic}`')
-        return cls(destination, source, value)
 
-class AddIntegerInstruction(MathIntegerInstruction, mneumonic='addi'):
-    pass
+@instruction('addi')
+class AddIntegerInstruction(MathIntegerInstruction):
+    __slots__ = ()
 
 
-class MultiplyIntegerInstruction(MathIntegerInstruction, mneumonic='muli'):
+@instruction('muli')
+class MultiplyIntegerInstruction(MathIntegerInstruction):
     """$D = $S * value
     For technical reasons, $D cannot be $t9
     """
-    def construct(self, ctxt: Context) -> str:
-        return construct([
-            LoadIntegerInstruction(RegisterNode('$t9'), self.value),
-            MultiplyRegisterInstruction(self.destination, RegisterNode('$t9'), self.source),
-        ], ctxt)
+    __slots__ = ()
+
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        k = self.value.value
+        if k == 0:
+            return [MoveInstruction(RegisterNode.zero, self.destination)]
+        if k == 1:
+            return [MoveInstruction(self.source, self.destination)]
+        if k == -1:
+            return [GenericInstruction.parse_arguments([self.destination, RegisterNode.zero, self.source], IdentifierNode('sub'))]
+        if k > 0 and k & (k - 1) == 0:
+            shift = NumberNode(k.bit_length() - 1)
+            return [GenericInstruction.parse_arguments([self.destination, self.source, shift], IdentifierNode('sll'))]
+        return [
+            LoadIntegerInstruction(RegisterNode.t9, self.value),
+            MultiplyRegisterInstruction(self.destination, RegisterNode.t9, self.source),
+        ]
 
 
-class MultiplyRegisterInstruction(MathRegisterInstruction, mneumonic='mul'):
-    pass
+@instruction('mul')
+class MultiplyRegisterInstruction(MathRegisterInstruction):
+    __slots__ = ()
 
 
-class ModuloIntegerInstruction(MathIntegerInstruction, mneumonic='modi'):
-    def construct(self, ctxt: Context) -> str:
-        return construct([
-            LoadIntegerInstruction(RegisterNode('$t9'), self.value),
-            ModuloRegisterInstruction(self.destination, self.source, RegisterNode('$t9')),
-        ], ctxt)
+@instruction('modi')
+class ModuloIntegerInstruction(MathIntegerInstruction):
+    __slots__ = ()
 
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        return [
+            LoadIntegerInstruction(RegisterNode.t9, self.value),
+            ModuloRegisterInstruction(self.destination, self.source, RegisterNode.t9),
+        ]
 
-class ModuloRegisterInstruction(MathRegisterInstruction, mneumonic='mod'):
-    def construct(self, ctxt: Context) -> str:
-        return construct([
-            GenericInstruction.parse_arguments([IdentifierNode('div'), self.source, self.value]),
-            GenericInstruction.parse_arguments([IdentifierNode('mfhi'), self.destination]),
-        ], ctxt)
 
+@instruction('mod')
+class ModuloRegisterInstruction(MathRegisterInstruction):
+    __slots__ = ()
+
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        return [
+            GenericInstruction.parse_arguments([self.source, self.value], IdentifierNode('div')),
+            GenericInstruction.parse_arguments([self.destination], IdentifierNode('mfhi')),
+        ]
+
+
+@instruction('call')
+@dataclass(slots=True)
+class CallInstruction(InstructionNode):
+    __operands__ = (IdentifierNode,),
 
-@dataclass
-class CallInstruction(InstructionNode, mneumonic='call'):
     proc: IdentifierNode
 
-    def register(self, ctxt: Context) -> Context:
-        ctxt.symbols[self.proc] += 1
-        return super().register(ctxt)
+    def register(self, ctxt: Context) -> list[Node] | tuple[Node, ...] | None:
+        ctxt.symbols[self.proc.name] += 1
+        return InstructionNode.register(self, ctxt)
 
-    def construct(self, ctxt: Context) -> str:
-        parameters = ctxt.procedures[self.proc.name]
-        spill_depth = sum(1 for p in parameters.values() if isinstance(p, PointerNode) and p.base == RegisterNode.sp)
-        spill_ctxt = SpillContext(ctxt)
-        return construct([
+    def procedure(self, ctxt: Context) -> ProcedureInfo:
+        procedure = ctxt.procedures.get(self.proc.name)
+        if procedure is None:
+            raise ValueError(f'Unknown procedure {self.proc.name}')
+        return procedure
+
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        spill, unspill = spill_template((RegisterNode.ra,), self.procedure(ctxt).spill_depth, ctxt.verbose)
+        return [
             CommentNode(f'Call procedure {self.proc.name}'),
-            spill_ctxt.spill(RegisterNode.ra, depth=spill_depth),
+            spill,
             JumpAndLinkInstruction(self.proc),
-            spill_ctxt.unspill(),
-        ], ctxt)
+            unspill,
+        ]
 
-    @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
-        proc = arguments[0]
-        if not isinstance(proc, IdentifierNode):
-            raise ValueError(f'`call` expects a procedure to call')
-        return cls(proc)
+    def bare(self) -> list[Node]:
+        """The call without saving $ra, for use inside a CallBlockNode"""
+        return [
+            CommentNode(f'Call procedure {self.proc.name}'),
+            JumpAndLinkInstruction(self.proc),
+        ]
 
 
-@dataclass
-class SyscallInstruction(InstructionNode, mneumonic='syscall'):
+@dataclass(slots=True)
+class CallBlockNode(Node):
+    """A run of calls that share a single spill of $ra
+    Only calls without stack parameters are grouped, so nothing needs to stay on top
+    """
+    body: list[Node]
+
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        spill, unspill = spill_template((RegisterNode.ra,), 0, ctxt.verbose)
+        return [
+            spill,
+            [node.bare() if type(node) is CallInstruction else node for node in self.body],
+            unspill,
+        ]
+
+
+def coalesce_calls(body: list[Node], ctxt: Context) -> list[Node]:
+    """Group consecutive calls (with only comments between them) into CallBlockNodes"""
+    def groupable(node: Node) -> bool:
+        if type(node) is not CallInstruction:
+            return False
+        procedure = ctxt.procedures.get(node.proc.name)
+        return procedure is not None and procedure.spill_depth == 0
+
+    # Only allocated once a block is formed; otherwise `body` is returned as is
+    result: list[Node] | None = None
+    copied = 0
+    i, n = 0, len(body)
+    while i < n:
+        if not groupable(body[i]):
+            i += 1
+            continue
+        start = last = i
+        j = i + 1
+        while j < n and (type(body[j]) is CommentNode or groupable(body[j])):
+            if type(body[j]) is CallInstruction:
+                last = j
+            j += 1
+        # Comments after the last call stay outside the block
+        if last > start:
+            if result is None:
+                result = body[:start]
+            else:
+                result.extend(body[copied:start])
+            result.append(CallBlockNode(body[start:last + 1]))
+            copied = last + 1
+        i = last + 1
+    if result is None:
+        return body
+    result.extend(body[copied:])
+    return result
+
+
+@instruction('syscall')
+@dataclass(slots=True)
+class SyscallInstruction(InstructionNode):
+    __operands__ = (IdentifierNode,),
+
     identifier: IdentifierNode | None = None
 
-    SYSCALLS = {}
-    for line in (root / 'syscalls.txt').open('r'):
-        name, id, *_ = line.split(' ')
-        SYSCALLS[name] = id
+    SYSCALLS = syscalls.SYSCALLS
 
     def construct(self, ctxt: Context) -> str:
         if self.identifier is None:
-            return super().construct(ctxt)
-        syscall_name = self.identifier.name
-        syscall_id = self.SYSCALLS.get(syscall_name)
-        if syscall_id is None:
-            raise ValueError(f'Unknown syscall {syscall_name}')
-        spill_ctxt = SpillContext(ctxt)
-        return '\n'.join(
-            filter(
-                lambda x: x.strip(),
-                construct([
-                    spill_ctxt.spill(RegisterNode.v0),
-                    LoadIntegerInstruction(RegisterNode.v0, NumberNode(syscall_id)),
-                    SyscallInstruction(),
-                    StoreWordInstruction(IdentifierNode('_return'), RegisterNode.v0),
-                    spill_ctxt.unspill(),
-                ], ctxt).splitlines()
-            )
-        )
+            return InstructionNode.construct(self, ctxt)
+        return syscall_template(self.identifier.name, ctxt.verbose)
 
     @classmethod
-    def parse_arguments(cls, arguments: list[Node]) -> InstructionNode:
+    def parse_arguments(cls, arguments: list[Node], mneumonic: IdentifierNode | None = None) -> InstructionNode:
         if len(arguments) == 0:
             return cls()
-        identifier = arguments[0]
-        if not isinstance(identifier, IdentifierNode):
-            raise ValueError(f'Expected an identifier if `syscall` is to be given an argument')
-        return cls(identifier)
+        cls.check_arguments(arguments)
+        return cls(*arguments)
 
 
 
@@ -1,68 +1,120 @@
 from __future__ import annotations
 
-from abc import ABC, abstractmethod
-from collections import defaultdict, OrderedDict
+from abc import ABC
+from collections import defaultdict
 from collections.abc import Callable
 from dataclasses import dataclass, field
 from functools import partial
+import re
+import sys
+from typing import ClassVar
 import warnings
 from warnings import warn
 
 
+BLANK_LINES = re.compile(r'\n{3,}')
+
+# Symbols that are used implicitly, so are never reported as unused
+RESERVED_SYMBOLS = frozenset({'main'})
+
+
+# Keyed by exact type; `list` and `str` are added below alongside construct()
+CONSTRUCTORS: dict[type, Callable[[Node, Context], str]] = {}
+EMITTERS: dict[type[Node], Callable[[Node, list[str], Context], list | None]] = {}
+REGISTRARS: dict[type[Node], Callable[[Node, Context], list | tuple | None]] = {}
+
+
 class Node(ABC):
-    def register(self, ctxt: Context) -> Context:
-        return ctxt
+    """Subclasses override `construct` to render themselves as a string, or
+    `emit` to append their output lines to a shared buffer. A composite node's
+    `emit` may instead return its children, which are emitted in its place.
+    Likewise `register` records the node in the context and returns any
+    children that still need registering.
+    """
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        if 'emit' in vars(cls) and 'construct' not in vars(cls):
+            cls.construct = Node.construct
+        CONSTRUCTORS[cls] = cls.construct
+        EMITTERS[cls] = cls.emit
+        REGISTRARS[cls] = cls.register
+
+    def register(self, ctxt: Context) -> list[Node] | tuple[Node, ...] | None:
+        return None
+
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str] | None:
+        part = self.construct(ctxt).rstrip()
+        if part:
+            out.append(part)
+        return None
 
-    @abstractmethod
     def construct(self, ctxt: Context) -> str:
-        raise NotImplemented()
+        out: list[str] = []
+        emit(self, out, ctxt)
+        return BLANK_LINES.sub('\n\n', '\n'.join(out))
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CommentNode(Node):
     comment: str
+    _text: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, '_text', f'# {self.comment}')
 
     def construct(self, ctxt: Context) -> str:
         if not ctxt.verbose:
             return ''
-        return f'# {self.comment}'
+        return self._text
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class DocCommentNode(Node):
     item: IdentifierNode
     comments: list[CommentNode]
     
-    def construct(self, ctxt: Context) -> str:
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str] | None:
         if not self.comments or not ctxt.verbose:
-            return ''
-        return construct([
+            return None
+        return [
             f'\n## {construct(self.item, ctxt)}',
             self.comments,
             '##',
-        ], ctxt)
+        ]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class NumberNode(Node):
     value: int
     convert: Callable[[int], str] = str
+    _text: str = field(init=False, repr=False, compare=False)
+    _verbose_text: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, '_text', str(self.value))
+        object.__setattr__(self, '_verbose_text', self.convert(self.value))
 
     def construct(self, ctxt: Context) -> str:
         if not ctxt.verbose:
-            return str(self.value)
-        return self.convert(self.value)
+            return self._text
+        return self._verbose_text
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class StringNode(Node):
     value: str
+    _text: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, '_text', f'"{self.value}"')
 
     def construct(self, ctxt: Context) -> str:
-        return f'"{self.value}"'
+        return self._text
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ArrayNode(Node):
     value: list[NumberNode]
 
@@ -70,69 +122,109 @@ class ArrayNode(Node):
         return ', '.join(construct(v, ctxt) for v in self.value)
 
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class IdentifierNode(Node):
     name: str
 
-    def register(self, ctxt: Context) -> Context:
-        ctxt.symbols[self] += 1
-        return super().register(ctxt)
+    def __post_init__(self) -> None:
+        object.__setattr__(self, 'name', sys.intern(self.name))
+
+    def register(self, ctxt: Context) -> list[Node] | tuple[Node, ...] | None:
+        ctxt.symbols[self.name] += 1
+        return None
 
     def construct(self, ctxt: Context) -> str:
         return self.name
 
 
-@dataclass(frozen=True, eq=True)
+@dataclass(frozen=True, eq=True, init=False, slots=True)
 class RegisterNode(Node):
     reg: str
+    _text: str = field(init=False, repr=False, compare=False)
+    _pool: ClassVar[dict[str, RegisterNode]] = {}
+    zero: ClassVar[RegisterNode]
+    v0: ClassVar[RegisterNode]
+    v1: ClassVar[RegisterNode]
+    sp: ClassVar[RegisterNode]
+    ra: ClassVar[RegisterNode]
+    t9: ClassVar[RegisterNode]
+
+    def __new__(cls, reg: str) -> RegisterNode:
+        self = cls._pool.get(reg)
+        if self is None:
+            self = object.__new__(cls)
+            object.__setattr__(self, 'reg', reg)
+            object.__setattr__(self, '_text', '$zero' if reg == '$0' else reg)
+            cls._pool[reg] = self
+        return self
+
+    def __getnewargs__(self) -> tuple[str]:
+        return self.reg,
 
     def construct(self, ctxt: Context) -> str:
-        if self.reg == '$0':
-            return '$zero'
-        return self.reg
-
-    @classmethod
-    @property
-    def v0(cls) -> RegisterNode:
-        return cls('$v0')
-
-    @classmethod
-    @property
-    def v1(cls) -> RegisterNode:
-        return cls('$v1')
+        return self._text
 
 
-    @classmethod
-    @property
-    def sp(cls) -> RegisterNode:
-        return cls('$sp')
+REGISTERS = tuple(map(RegisterNode, (
+    '$zero', '$at', '$v0', '$v1',
+    *(f'$a{i}' for i in range(4)),
+    *(f'$t{i}' for i in range(10)),
+    *(f'$s{i}' for i in range(8)),
+    '$k0', '$k1', '$gp', '$sp', '$fp', '$ra',
+)))
 
-    @classmethod
-    @property
-    def ra(cls) -> RegisterNode:
-        return cls('$ra')
+RegisterNode.zero = RegisterNode('$zero')
+RegisterNode.v0 = RegisterNode('$v0')
+RegisterNode.v1 = RegisterNode('$v1')
+RegisterNode.sp = RegisterNode('$sp')
+RegisterNode.ra = RegisterNode('$ra')
+RegisterNode.t9 = RegisterNode('$t9')
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PointerNode(Node):
     base: RegisterNode
     offset: NumberNode
+    _text: str = field(init=False, repr=False, compare=False)
+    _verbose_text: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(self, '_text', f'{self.offset._text}({self.base._text})')
+        object.__setattr__(self, '_verbose_text', f'{self.offset._verbose_text}({self.base._text})')
 
     def construct(self, ctxt: Context) -> str:
-        return f'{construct(self.offset, ctxt)}({construct(self.base, ctxt)})'
+        if not ctxt.verbose:
+            return self._text
+        return self._verbose_text
 
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class LabelNode(Node):
     name: IdentifierNode
+    _text: str = field(init=False, repr=False, compare=False)
 
-    def register(self, ctxt: Context) -> Context:
-        if self.name not in ctxt.symbols:
-            ctxt.symbols[self.name] = 0
-        return super().register(ctxt)
+    def __post_init__(self) -> None:
+        object.__setattr__(self, '_text', f'\n{self.name.name}:')
+
+    def register(self, ctxt: Context) -> list[Node] | tuple[Node, ...] | None:
+        if self.name.name not in ctxt.symbols:
+            ctxt.symbols[self.name.name] = 0
+        return None
 
     def construct(self, ctxt: Context) -> str:
-        return f'\n{construct(self.name, ctxt)}:'
+        return self._text
+
+
+@dataclass(slots=True)
+class ProcedureInfo:
+    parameters: dict[str, RegisterNode | PointerNode]
+    spill_depth: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.spill_depth = sum(
+            1 for p in self.parameters.values()
+            if isinstance(p, PointerNode) and p.base == RegisterNode.sp
+        )
 
 
 class UnusedSymbolWarning(UserWarning):
@@ -141,39 +233,73 @@ class UnusedSymbolWarning(UserWarning):
 
 @dataclass()
 class Context:
-    procedures: dict[str, OrderedDict[str, RegisterNode | PointerNode]] = field(default_factory=partial(defaultdict, list), init=False)
-    symbols: defaultdict[IdentifierNode, int] = field(default_factory=partial(defaultdict, int), init=False)
+    procedures: dict[str, ProcedureInfo] = field(default_factory=dict, init=False)
+    symbols: defaultdict[str, int] = field(default_factory=partial(defaultdict, int), init=False)
     verbose: bool = False
 
     def validate(self) -> None:
+        unused = [
+            symbol for symbol, count in self.symbols.items()
+            if count == 0 and not symbol.startswith('_') and symbol not in RESERVED_SYMBOLS
+        ]
+        if not unused:
+            return
         warnings.simplefilter('always', UnusedSymbolWarning)
-        for symbol, count in self.symbols.items():
-            if count != 0:
-                continue
-            if symbol.name.startswith('_'):
-                continue
-            if symbol.name in {'main'}:
-                continue
-            warn(f'{symbol.name} is unused', UnusedSymbolWarning)
+        warn(f'{", ".join(unused)} {"is" if len(unused) == 1 else "are"} unused', UnusedSymbolWarning, stacklevel=2)
 
 
 def register(ast, ctxt: Context | None = None) -> Context:
     if ctxt is None:
         ctxt = Context()
-    if isinstance(ast, list):
-        for n in ast:
-            ctxt = register(n, ctxt)
-        return ctxt
-    return ast.register(ctxt)
+    # As in emit(), lists and the children returned by composite nodes are
+    # walked with an explicit stack rather than by recursion.
+    stack = [ast]
+    while stack:
+        n = stack.pop()
+        t = type(n)
+        if t is list:
+            stack.extend(reversed(n))
+            continue
+        children = REGISTRARS[t](n, ctxt)
+        if children is not None:
+            stack.extend(reversed(children))
+    return ctxt
+
+
+def emit(ast, out: list[str], ctxt: Context) -> None:
+    # Nested lists and the children returned by composite nodes are walked
+    # with an explicit stack rather than by recursion, and children that
+    # construct to nothing (e.g. comments outside verbose mode) are skipped.
+    stack = [ast]
+    while stack:
+        n = stack.pop()
+        t = type(n)
+        if t is list:
+            stack.extend(reversed(n))
+        elif t is str:
+            part = n.rstrip()
+            if part:
+                out.append(part)
+        else:
+            children = EMITTERS[t](n, out, ctxt)
+            if children is not None:
+                stack.extend(reversed(children))
+
+
+def _construct_list(ast: list, ctxt: Context) -> str:
+    out: list[str] = []
+    emit(ast, out, ctxt)
+    return BLANK_LINES.sub('\n\n', '\n'.join(out))
+
+
+def _construct_str(ast: str, ctxt: Context) -> str:
+    return ast
+
+
+CONSTRUCTORS[list] = _construct_list
+CONSTRUCTORS[str] = _construct_str
 
 
 def construct(ast, ctxt: Context) -> str:
-    if isinstance(ast, list):
-        result = '\n'.join(construct(n, ctxt).rstrip() for n in ast)
-        while '\n\n\n' in result:
-            result = result.replace('\n\n\n', '\n\n')
-        return result
-    if isinstance(ast, str):
-        return ast
-    return ast.construct(ctxt)
+    return CONSTRUCTORS[type(ast)](ast, ctxt)
 
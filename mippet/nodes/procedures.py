@@ -1,110 +1,112 @@
-from collections import OrderedDict
 from dataclasses import dataclass, field
+from itertools import chain
 
-from .instruction import CallInstruction, SpillContext, InstructionNode, JumpRegisterInstruction, SyscallInstruction
+from .instruction import CallInstruction, InstructionNode, JumpRegisterInstruction, SyscallInstruction, coalesce_calls, instruction, spill_template
 from .node import *
 
 
 PROCEDURE_SPILLS = tuple(RegisterNode(f'$s{i}') for i in range(8))
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class SectionNode(Node):
     typ: str
     body: list[Node]
 
-    def register(self, ctxt: Context) -> Context:
-        return register(self.body, ctxt)
+    def register(self, ctxt: Context) -> list[Node] | tuple[Node, ...] | None:
+        return self.body
 
-    def construct(self, ctxt: Context) -> str:
-        return construct([
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        return [
             self.typ,
             LabelNode(IdentifierNode('entry')),
             CallInstruction(IdentifierNode('main')),
             SyscallInstruction(IdentifierNode('halt')),
-            self.body,
+            coalesce_calls(self.body, ctxt),
             '\n'
-        ], ctxt)
+        ]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class KernelTextSectionNode(SectionNode):
     address: NumberNode
     typ: str = field(default='.ktext', init=False)
 
-    def construct(self, ctxt: Context) -> str:
-        return construct([
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        return [
             f'{self.typ} {construct(self.address, ctxt)}',
-            self.body,
+            coalesce_calls(self.body, ctxt),
             '\n',
-        ], ctxt)
+        ]
 
 
 class DataNode(Node, ABC):
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class StringDataDefinitionNode(DataNode):
     data: StringNode
     is_null_terminated: bool = True
 
-    def construct(self, ctxt: Context) -> str:
-        return construct([
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        return [
             '.asciiz' if self.is_null_terminated else '.ascii',
             self.data,
-        ], ctxt)
+        ]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class WordDataDefinitionNode(DataNode):
     data: NumberNode | ArrayNode
 
-    def construct(self, ctxt: Context) -> str:
-        return construct([
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        return [
             '.word',
             self.data,
-        ], ctxt)
+        ]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class DataSectionNode(SectionNode):
     typ: str = field(default='.data', init=False)
     body: dict[LabelNode, DataNode]
 
-    def register(self, ctxt: Context) -> Context:
-        for k, v in self.body.items():
-            ctxt = register(k, ctxt)
-            ctxt = register(v, ctxt)
-        return ctxt
-
-    def construct(self, ctxt: Context) -> str:
-        return construct(
-            [
-                '.data',
-                LabelNode(IdentifierNode('_return')),
-                CommentNode('A place to store return values from syscalls'),
-                CommentNode('Useful as we spill `$v0` around syscalls'),
-                WordDataDefinitionNode(NumberNode(0)),
-            ] + [list(x) for x in self.body.items()],
-            ctxt
-        )
-
-
-@dataclass
+    def register(self, ctxt: Context) -> list[Node] | tuple[Node, ...] | None:
+        return list(chain.from_iterable(self.body.items()))
+
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        return [
+            '.data',
+            LabelNode(IdentifierNode('_return')),
+            CommentNode('A place to store return values from syscalls'),
+            CommentNode('Useful as we spill `$v0` around syscalls'),
+            WordDataDefinitionNode(NumberNode(0)),
+            *chain.from_iterable(self.body.items()),
+        ]
+
+
+@dataclass(frozen=True, slots=True)
 class ProcedureNode(Node):
     name: IdentifierNode
-    parameters: OrderedDict[str, RegisterNode | PointerNode]
+    parameters: dict[str, RegisterNode | PointerNode]
     documentation: list[DocCommentNode] = field(default_factory=list)
-
-    def register(self, ctxt: Context) -> Context:
-        ctxt.procedures[self.name.name] = self.parameters
-        if self.name not in ctxt.symbols:
-            ctxt.symbols[self.name] = 0
-        return super().register(ctxt)
-
-    def construct(self, ctxt: Context) -> str:
-        _construct = partial(construct, ctxt=ctxt)
+    _comments: list[CommentNode] | None = field(default=None, init=False, repr=False, compare=False)
+
+    def register(self, ctxt: Context) -> list[Node] | tuple[Node, ...] | None:
+        # emit and calls look procedures up by name, so names must be unique
+        if self.name.name in ctxt.procedures:
+            raise ValueError(f'Duplicate procedure {self.name.name}')
+        ctxt.procedures[self.name.name] = ProcedureInfo(self.parameters)
+        if self.name.name not in ctxt.symbols:
+            ctxt.symbols[self.name.name] = 0
+        return None
+
+    def comments(self) -> list[CommentNode]:
+        # Comments only appear in verbose output, so they always use its spellings
+        if self._comments is not None:
+            return self._comments
+        ctxt = Context(verbose=True)
         doc_comments = []
         for doc in self.documentation:
             doc_comments.extend(doc.comments)
@@ -114,51 +116,41 @@ class ProcedureNode(Node):
                 CommentNode(f'{construct(r, ctxt)}: {name}')
                 for name, r in self.parameters.items()
             ])
-        spill_ctxt = SpillContext(ctxt)
-        documentation = _construct(doc_comments)
-        label = _construct(LabelNode(self.name))
-        if documentation:
-            label = label.lstrip()
-            documentation = '\n' + documentation
-        spill = _construct([
-            spill_ctxt.spill(
-                *PROCEDURE_SPILLS,
-                depth=len([
-                    p for p in self.parameters.values()
-                    if isinstance(p, PointerNode) and p.base == RegisterNode.sp
-                ])
-            )
-        ])
-        return '\n'.join(
-            filter(
-                lambda x: x.strip(),
-                [documentation, label, spill],
-            )
-        )
-
-
-class ReturnInstruction(InstructionNode, mneumonic='ret'):
-    def construct(self, ctxt: Context) -> str:
-        return construct([
-            SpillContext(ctxt).unspill(PROCEDURE_SPILLS),
+        object.__setattr__(self, '_comments', doc_comments)
+        return doc_comments
+
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        spill, _ = spill_template(PROCEDURE_SPILLS, ctxt.procedures[self.name.name].spill_depth, ctxt.verbose)
+        documentation = self.comments() if ctxt.verbose else []
+        if not documentation:
+            return [LabelNode(self.name), spill]
+        # The blank line moves from the label to above the documentation
+        out.append('')
+        return [documentation, f'{self.name.name}:', spill]
+
+
+@instruction('ret')
+class ReturnInstruction(InstructionNode):
+    __slots__ = ()
+
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        return [
+            spill_template(PROCEDURE_SPILLS, 0, ctxt.verbose)[1],
             CommentNode('Return to the caller'),
             JumpRegisterInstruction(RegisterNode.ra),
-        ], ctxt)
+        ]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ProgramNode(Node):
     text: SectionNode | None = None
     data: DataSectionNode = field(default_factory=lambda: DataSectionNode({}))
 
-    def register(self, ctxt: Context) -> Context:
-        ctxt = register(self.text, ctxt)
-        ctxt = register(self.data, ctxt)
-        return ctxt
+    def register(self, ctxt: Context) -> list[Node] | tuple[Node, ...] | None:
+        return [self.text, self.data]
 
-    def construct(self, ctxt: Context) -> str:
-        return construct([
+    def emit(self, out: list[str], ctxt: Context) -> list[Node | str]:
+        return [
             self.data,
             self.text,
-        ], ctxt)
-
+        ]
@@ -1,4 +1,4 @@
-from collections import OrderedDict
+from functools import cache
 
 from rply import ParserGenerator, Token
 
@@ -8,7 +8,8 @@ from .tokens import Tokens
 __all__ = 'parse',
 
 
-pg = ParserGenerator(Tokens.keys())
+# rply caches the LALR tables on disk, keyed by a hash of the grammar
+pg = ParserGenerator(list(Tokens.keys()), cache_id='mippet')
 
 
 @pg.production('program : sections')
@@ -30,9 +31,10 @@ def sections_none(p):
     return []
 
 
-@pg.production('sections : section sections')
+@pg.production('sections : sections section')
 def sections_many(p):
-    return [p[0], *p[1]]
+    p[0].append(p[1])
+    return p[0]
 
 
 @pg.production('section : TEXT_SECTION statements')
@@ -54,7 +56,8 @@ def data_section(p):
 @pg.production('statements : statements statement')
 @pg.production(('data_definitions : data_definitions data_definition'))
 def statements(p):
-    return [*p[0], p[1]]
+    p[0].append(p[1])
+    return p[0]
 
 
 @pg.production('statements : statement')
@@ -119,7 +122,7 @@ def documented_procedure(p):
 
 @pg.production('procedure : KWD_PROC identifier OPEN_PAREN parameters CLOSE_PAREN COLON')
 def procedure(p):
-    return ProcedureNode(p[1], OrderedDict(p[3]))
+    return ProcedureNode(p[1], dict(p[3]))
 
 
 @pg.production('arguments : ')
@@ -127,14 +130,22 @@ def arguments_zero(p):
     return []
 
 
-@pg.production('arguments : argument')
+# A trailing comma is allowed after the last argument or parameter
+@pg.production('arguments : argument_list')
+@pg.production('arguments : argument_list COMMA')
+def arguments(p):
+    return p[0]
+
+
+@pg.production('argument_list : argument')
 def arguments_one(p):
     return [p[0]]
 
 
-@pg.production('arguments : argument COMMA arguments')
+@pg.production('argument_list : argument_list COMMA argument')
 def arguments_many(p):
-    return [p[0], *p[2]]
+    p[0].append(p[2])
+    return p[0]
 
 
 @pg.production('argument : number')
@@ -150,14 +161,21 @@ def parameters_zero(p):
     return []
 
 
-@pg.production('parameters : parameter')
+@pg.production('parameters : parameter_list')
+@pg.production('parameters : parameter_list COMMA')
+def parameters(p):
+    return p[0]
+
+
+@pg.production('parameter_list : parameter')
 def parameters_one(p):
     return [p[0]]
 
 
-@pg.production('parameters : parameter COMMA parameters')
+@pg.production('parameter_list : parameter_list COMMA parameter')
 def parameters_many(p):
-    return [p[0], *p[2]]
+    p[0].append(p[2])
+    return p[0]
 
 
 @pg.production('parameter : identifier COLON pointer')
@@ -171,14 +189,25 @@ def pointer(p):
     return PointerNode(p[2], p[0])
 
 
+# Number nodes are immutable, so every occurrence of a literal shares one node
+@cache
+def _number(text: str) -> NumberNode:
+    return NumberNode(int(text))
+
+
+@cache
+def _hex_number(text: str) -> NumberNode:
+    return NumberNode(int(text, 16), hex)
+
+
 @pg.production('number : NUMBER')
 def number(p):
-    return NumberNode(int(p[0].getstr()))
+    return _number(p[0].getstr())
 
 
 @pg.production('number : HEX_NUMBER')
 def hex_number(p):
-    return NumberNode(int(p[0].getstr(), 16), hex)
+    return _hex_number(p[0].getstr())
 
 
 @pg.production('string : STRING')
@@ -196,9 +225,10 @@ def array_items_one(p):
     return [p[0]]
 
 
-@pg.production('array_items : array_item COMMA array_items')
+@pg.production('array_items : array_items COMMA array_item')
 def array_items_many(p):
-    return [p[0], *p[2]]
+    p[0].append(p[2])
+    return p[0]
 
 
 @pg.production('array_item : number')
@@ -226,14 +256,10 @@ def comments_zero(p):
     return []
 
 
-@pg.production('comments : comment')
-def comments_one(p):
-    return [p[0]]
-
-
-@pg.production('comments : comment comments')
+@pg.production('comments : comments comment')
 def comments_many(p):
-    return [p[0], *p[1]]
+    p[0].append(p[1])
+    return p[0]
 
 
 @pg.production('comment : COMMENT')
@@ -246,6 +272,11 @@ def on_error(bad_token: Token):
     raise SyntaxError(f'Got unexpected {bad_token.name} ({bad_token.getstr()}) at {bad_token.getsourcepos()}')
 
 
-parser = pg.build()
+try:
+    parser = pg.build()
+except OSError:
+    # The cache directory is not writable, so build the tables without it
+    pg.cache_id = None
+    parser = pg.build()
 parse = parser.parse
 
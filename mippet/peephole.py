@@ -0,0 +1,62 @@
+import re
+
+__all__ = 'peephole',
+
+
+SP_ADJUST = re.compile(r'    addi \$sp, \$sp, (-?\d+)')
+STACK_ACCESS = re.compile(r'    (lw|sw) (\$\w+), (-?\d+\(\$sp\))')
+JUMP = re.compile(r'    (j|jr) (\S+)')
+LABEL = re.compile(r'(\w+):')
+
+
+def peephole(source: str) -> str:
+    """Clean up the redundant stack traffic left behind by spills
+    Comments and blank lines are transparent; labels and directives are barriers
+    """
+    out: list[str | None] = []
+    # Indices into `out` of the instructions since the last barrier
+    instructions: list[int] = []
+    unreachable = False
+    for line in source.split('\n'):
+        if not line or line.lstrip().startswith('#'):
+            out.append(line)
+            continue
+
+        if not line.startswith(' '):
+            unreachable = False
+            label = LABEL.fullmatch(line)
+            if label and instructions:
+                jump = JUMP.fullmatch(out[instructions[-1]])
+                if jump and jump[1] == 'j' and jump[2] == label[1]:
+                    out[instructions[-1]] = None
+            instructions.clear()
+            out.append(line)
+            continue
+
+        if unreachable:
+            continue
+
+        previous = out[instructions[-1]] if instructions else None
+        if previous is not None:
+            adjust = SP_ADJUST.fullmatch(line)
+            previous_adjust = adjust and SP_ADJUST.fullmatch(previous)
+            if previous_adjust:
+                # addi $sp, $sp, 4 / addi $sp, $sp, -4 cancel out
+                offset = int(previous_adjust[1]) + int(adjust[1])
+                if offset:
+                    out[instructions[-1]] = f'    addi $sp, $sp, {offset}'
+                else:
+                    out[instructions.pop()] = None
+                continue
+            access = STACK_ACCESS.fullmatch(line)
+            previous_access = access and STACK_ACCESS.fullmatch(previous)
+            if previous_access and previous_access[1] != access[1] and previous_access.groups()[1:] == access.groups()[1:]:
+                # The register and the stack slot already hold the same value
+                continue
+
+        instructions.append(len(out))
+        out.append(line)
+        if JUMP.fullmatch(line):
+            unreachable = True
+
+    return '\n'.join(line for line in out if line is not None)
@@ -0,0 +1,47 @@
+# Generated from syscalls.txt by scripts/gen_syscalls.py -- do not edit
+from types import MappingProxyType
+
+__all__ = 'SYSCALLS',
+
+
+SYSCALLS: MappingProxyType[str, int] = MappingProxyType({
+    'print_int': 1,
+    'print_float': 2,
+    'print_double': 3,
+    'print_string': 4,
+    'read_int': 5,
+    'read_float': 6,
+    'read_double': 7,
+    'read_string': 8,
+    'sbrk': 9,
+    'halt': 10,
+    'print_char': 11,
+    'read_char': 12,
+    'open_file': 13,
+    'read_file': 14,
+    'write_file': 15,
+    'close_file': 16,
+    'exit': 17,
+    'time': 30,
+    'midi_out': 31,
+    'sleep': 32,
+    'midi_out_sync': 33,
+    'print_int_hex': 34,
+    'print_int_bin': 35,
+    'print_uint': 36,
+    'set_seed': 40,
+    'random_int': 41,
+    'random_int_range': 42,
+    'random_float': 43,
+    'random_double': 44,
+    'ConfirmDialog': 50,
+    'InputDialogInt': 51,
+    'InputDialogFloat': 52,
+    'InputDialogDouble': 53,
+    'InputDialogString': 54,
+    'MessageDialog': 55,
+    'MessageDialogInt': 56,
+    'MessageDialogFloat': 57,
+    'MessageDialogDouble': 58,
+    'MessageDialogString': 59,
+})
@@ -0,0 +1,34 @@
+"""Regenerate mippet/syscalls.py from mippet/syscalls.txt
+
+Run this after editing syscalls.txt:
+    $ python3 scripts/gen_syscalls.py
+"""
+from pathlib import Path
+
+root = Path(__file__).resolve().parent.parent / 'mippet'
+
+
+def main() -> None:
+    entries = [
+        (name, int(syscall_id))
+        for name, syscall_id, *_ in (
+            line.split() for line in (root / 'syscalls.txt').read_text().splitlines() if line.strip()
+        )
+    ]
+    lines = [
+        '# Generated from syscalls.txt by scripts/gen_syscalls.py -- do not edit',
+        'from types import MappingProxyType',
+        '',
+        "__all__ = 'SYSCALLS',",
+        '',
+        '',
+        'SYSCALLS: MappingProxyType[str, int] = MappingProxyType({',
+        *(f'    {name!r}: {syscall_id},' for name, syscall_id in entries),
+        '})',
+        '',
+    ]
+    (root / 'syscalls.py').write_text('\n'.join(lines))
+
+
+if __name__ == '__main__':
+    main()